@@ -1,11 +1,29 @@
 import os
 import json
-from typing import List, Dict, Any, Optional
+import asyncio
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Iterable
 import requests
-from dataclasses import dataclass
+import aiohttp
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dataclasses import dataclass, field
 from datetime import datetime
 from dotenv import load_dotenv
 
+from json_utils import dumps as _dumps, loads as _loads, dumps_indented as _dumps_indented
+
+def _encode_examples(rows: List[Tuple[Any, bool]], tools_blob: Optional[bytes]) -> bytes:
+    """Encode (payload, spliced) rows as JSONL; spliced rows hold only messages and reuse tools_blob"""
+    parts = []
+    for payload, spliced in rows:
+        if spliced:
+            parts.append(b'{"messages":' + _dumps(payload) + b',"tools":' + tools_blob + b'}\n')
+        else:
+            parts.append(_dumps(payload) + b'\n')
+    return b''.join(parts)
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -14,23 +32,26 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_BASE_URL = "https://openrouter.ai/api/v1"
 MODEL_NAME = "qwen/qwen-2.5-72b-instruct"  # OpenRouter model identifier
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class Tool:
     """Represents a tool/function that the model can use"""
     name: str
     description: str
     parameters: Dict[str, Any]
+    _openai_format: Optional[Dict[str, Any]] = field(default=None, init=False, repr=False, compare=False)
     
     def to_openai_format(self) -> Dict[str, Any]:
-        """Convert to OpenAI function calling format"""
-        return {
-            "type": "function",
-            "function": {
-                "name": self.name,
-                "description": self.description,
-                "parameters": self.parameters
-            }
-        }
+        """Convert to OpenAI function calling format (built once, then shared)"""
+        if self._openai_format is None:
+            object.__setattr__(self, "_openai_format", {
+                "type": "function",
+                "function": {
+                    "name": self.name,
+                    "description": self.description,
+                    "parameters": self.parameters
+                }
+            })
+        return self._openai_format
 
 class QwenFineTuner:
     """Fine-tuning manager for Qwen3 model via OpenRouter"""
@@ -49,12 +70,65 @@ class QwenFineTuner:
         
         self.tools: List[Tool] = []
         self.training_data: List[Dict[str, Any]] = []
+        # OpenAI-format tool list shared by every example, or None until a tool is added;
+        # replaced (never mutated) on add_tool
+        self._tools_payload: Optional[List[Dict[str, Any]]] = None
+        self._tool_choice: Optional[str] = None
+        
+        # Persistent session so repeated calls reuse the TLS connection
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            # Chat completions are POSTs, so retries are limited to failures where
+            # the request was never processed: connection errors and 429/503,
+            # honouring Retry-After. Read errors are not retried.
+            max_retries=Retry(
+                total=3,
+                read=0,
+                backoff_factor=0.3,
+                status_forcelist=[429, 503],
+                allowed_methods=frozenset({"POST"}),
+                respect_retry_after_header=True,
+                raise_on_status=False
+            )
+        ))
+        self.session.headers.update(self.headers)
+        
+        # Async session for batched evaluation, created lazily inside a running loop
+        # and recreated when called from a different one
+        self.aiosession: Optional[aiohttp.ClientSession] = None
+        self._aiosession_loop: Optional[asyncio.AbstractEventLoop] = None
+        
+        # (system_prompt, tools_payload, prefix, suffix) of the last rendered prompt template
+        self._template_cache: Optional[Tuple[str, Optional[List[Dict[str, Any]]], str, str]] = None
+    
+    def close(self):
+        """Close the underlying HTTP session"""
+        self.session.close()
+    
+    def __del__(self):
+        session = getattr(self, "session", None)
+        if session is not None:
+            session.close()
     
     def add_tool(self, tool: Tool):
         """Add a tool to the model's capability"""
         self.tools.append(tool)
+        self._tools_payload = (self._tools_payload or []) + [tool.to_openai_format()]
+        self._tool_choice = "auto"
         print(f"Added tool: {tool.name}")
     
+    def add_tools(self, tools: Iterable[Tool]):
+        """Add several tools at once, rebuilding the shared tools payload a single time"""
+        tools = list(tools)
+        if not tools:
+            return
+        self.tools.extend(tools)
+        self._tools_payload = (self._tools_payload or []) + [tool.to_openai_format() for tool in tools]
+        self._tool_choice = "auto"
+        print(f"Added {len(tools)} tools: {', '.join(tool.name for tool in tools)}")
+    
     def create_training_example(self, 
                               user_message: str, 
                               assistant_message: str,
@@ -74,11 +148,11 @@ class QwenFineTuner:
             })
             
             # Add tool results
-            for i, result in enumerate(tool_results):
+            for call, result in zip(tool_calls, tool_results):
                 messages.append({
                     "role": "tool",
-                    "tool_call_id": tool_calls[i]["id"],
-                    "content": json.dumps(result)
+                    "tool_call_id": call["id"],
+                    "content": _dumps(result).decode()
                 })
             
             # Add final assistant response
@@ -95,58 +169,188 @@ class QwenFineTuner:
         
         return {
             "messages": messages,
-            "tools": [tool.to_openai_format() for tool in self.tools] if self.tools else None
+            "tools": self._tools_payload
         }
     
+    def create_training_examples_batch(self,
+                                       user_messages: Iterable[str],
+                                       assistant_messages: Iterable[str],
+                                       tool_calls_list: Optional[Iterable[Optional[List[Dict[str, Any]]]]] = None,
+                                       tool_results_list: Optional[Iterable[Optional[List[Dict[str, Any]]]]] = None) -> List[Dict[str, Any]]:
+        """Create training examples from parallel columns (lists or DataFrame columns) and add them to the dataset"""
+        create = self.create_training_example
+        user_messages = list(user_messages)
+        rows = len(user_messages)
+        examples = [
+            create(user_message, assistant_message, tool_calls, tool_results)
+            for user_message, assistant_message, tool_calls, tool_results in zip(
+                user_messages,
+                assistant_messages,
+                itertools.repeat(None, rows) if tool_calls_list is None else tool_calls_list,
+                itertools.repeat(None, rows) if tool_results_list is None else tool_results_list,
+                # Columns must line up exactly; a short or long one raises
+                # ValueError rather than silently dropping rows
+                strict=True
+            )
+        ]
+        self.training_data.extend(examples)
+        print(f"Added {len(examples)} training examples ({len(self.training_data)} total)")
+        return examples
+    
     def add_training_example(self, example: Dict[str, Any]):
         """Add a training example to the dataset"""
         self.training_data.append(example)
         print(f"Added training example {len(self.training_data)}")
     
-    def save_training_data(self, filename: str = "training_data.jsonl"):
-        """Save training data in JSONL format"""
-        with open(filename, 'w') as f:
-            for example in self.training_data:
-                f.write(json.dumps(example) + '\n')
+    def save_training_data(self, filename: str = "training_data.jsonl",
+                           workers: Optional[int] = None, chunk_size: int = 1000):
+        """Save training data in JSONL format, optionally encoding chunks in worker processes"""
+        # Encode the shared tools list once and splice it into every example that uses it
+        tools_payload = self._tools_payload
+        tools_blob = _dumps(tools_payload) if tools_payload is not None else None
+        rows = [
+            (example["messages"], True)
+            if tools_blob is not None and example.keys() == {"messages", "tools"} and example["tools"] is tools_payload
+            else (example, False)
+            for example in self.training_data
+        ]
+        chunks = [rows[i:i + chunk_size] for i in range(0, len(rows), chunk_size)]
+        
+        with open(filename, 'wb', buffering=1 << 20) as f:
+            if workers and len(chunks) > 1:
+                with ProcessPoolExecutor(max_workers=workers) as executor:
+                    for blob in executor.map(_encode_examples, chunks, itertools.repeat(tools_blob)):
+                        f.write(blob)
+            else:
+                for chunk in chunks:
+                    f.write(_encode_examples(chunk, tools_blob))
         print(f"Saved {len(self.training_data)} training examples to {filename}")
     
-    def test_model_with_tools(self, prompt: str) -> Dict[str, Any]:
-        """Test the model with tool support"""
-        payload = {
+    @staticmethod
+    def load_training_data(filename: str = "training_data.jsonl") -> List[Dict[str, Any]]:
+        """Load training examples from a JSONL file"""
+        with open(filename, 'rb') as f:
+            return [_loads(line) for line in f.read().splitlines() if line.strip()]
+    
+    async def asave_training_data(self, filename: str = "training_data.jsonl", **kwargs):
+        """Save training data from async code without blocking the event loop"""
+        await asyncio.to_thread(self.save_training_data, filename, **kwargs)
+    
+    def _build_payload(self, prompt: str) -> Dict[str, Any]:
+        """Build the chat completion payload for a single prompt"""
+        return {
             "model": MODEL_NAME,
             "messages": [
                 {"role": "user", "content": prompt}
             ],
-            "tools": [tool.to_openai_format() for tool in self.tools] if self.tools else None,
-            "tool_choice": "auto" if self.tools else None
+            "tools": self._tools_payload,
+            "tool_choice": self._tool_choice
         }
+    
+    def test_model_with_tools(self, prompt: str) -> Dict[str, Any]:
+        """Test the model with tool support"""
+        payload = self._build_payload(prompt)
         
-        response = requests.post(
+        with self.session.post(
             f"{OPENROUTER_BASE_URL}/chat/completions",
-            headers=self.headers,
-            json=payload
-        )
-        
-        if response.status_code == 200:
-            return response.json()
-        else:
-            raise Exception(f"API request failed: {response.status_code} - {response.text}")
+            data=_dumps(payload),
+            timeout=(5, 60),
+            stream=True
+        ) as response:
+            if response.status_code != 200:
+                raise Exception(f"API request failed: {response.status_code} - {response.text}")
+            
+            # Accumulate the body in large chunks rather than requests' 10 KiB default
+            body = bytearray()
+            for chunk in response.iter_content(chunk_size=65536):
+                body.extend(chunk)
+            return _loads(body)
     
-    def create_custom_prompt_template(self, system_prompt: str) -> str:
-        """Create a custom prompt template for fine-tuning"""
-        return f"""<|system|>
+    def _ensure_aiosession(self) -> aiohttp.ClientSession:
+        """Return the pooled async session, creating it inside the running loop if needed"""
+        loop = asyncio.get_running_loop()
+        # A session only works on the loop it was created on, and each asyncio.run()
+        # starts a new loop; a session left on a finished loop cannot be closed
+        # from this one, so it is just dropped
+        if self.aiosession is None or self.aiosession.closed or self._aiosession_loop is not loop:
+            self._aiosession_loop = loop
+            self.aiosession = aiohttp.ClientSession(
+                headers=self.headers,
+                connector=aiohttp.TCPConnector(
+                    limit=100,
+                    limit_per_host=20,
+                    ttl_dns_cache=300,
+                    keepalive_timeout=75
+                ),
+                timeout=aiohttp.ClientTimeout(total=60, connect=5)
+            )
+        return self.aiosession
+    
+    async def atest_model_with_tools(self, prompt: str) -> Dict[str, Any]:
+        """Test the model with tool support without blocking the event loop"""
+        async with self._ensure_aiosession().post(
+            f"{OPENROUTER_BASE_URL}/chat/completions",
+            data=_dumps(self._build_payload(prompt))
+        ) as response:
+            if response.status == 200:
+                return _loads(await response.read())
+            raise Exception(f"API request failed: {response.status} - {await response.text()}")
+    
+    async def _atest(self, prompt: str, sem: asyncio.Semaphore) -> Dict[str, Any]:
+        """Send a single prompt once a concurrency slot is free"""
+        async with sem:
+            return await self.atest_model_with_tools(prompt)
+    
+    async def test_model_batch(self, prompts: List[str], concurrency: int = 10) -> List[Dict[str, Any]]:
+        """Test the model with many prompts concurrently, preserving prompt order"""
+        # A session this call creates is closed when it finishes; one the caller
+        # already had open on this loop is left for them to aclose()
+        session = self.aiosession
+        created = self._ensure_aiosession() is not session
+        sem = asyncio.Semaphore(concurrency)
+        try:
+            return await asyncio.gather(*[self._atest(prompt, sem) for prompt in prompts])
+        finally:
+            if created:
+                await self.aclose()
+    
+    async def aclose(self):
+        """Close the async HTTP session"""
+        if self.aiosession is not None:
+            await self.aiosession.close()
+            self.aiosession = None
+            self._aiosession_loop = None
+    
+    def _prompt_template_parts(self, system_prompt: str) -> Tuple[str, str]:
+        """Return the rendered template text before and after the user input slot"""
+        cache = self._template_cache
+        if cache is None or cache[0] != system_prompt or cache[1] is not self._tools_payload:
+            prefix = f"""<|system|>
 {system_prompt}
 
 Available tools:
-{json.dumps([tool.to_openai_format() for tool in self.tools], indent=2)}
+{_dumps_indented(self._tools_payload or [])}
 <|end|>
 
 <|user|>
-{{user_input}}
+"""
+            suffix = """
 <|end|>
 
 <|assistant|>
 """
+            cache = self._template_cache = (system_prompt, self._tools_payload, prefix, suffix)
+        return cache[2], cache[3]
+    
+    def create_custom_prompt_template(self, system_prompt: str) -> str:
+        """Create a custom prompt template for fine-tuning"""
+        prefix, suffix = self._prompt_template_parts(system_prompt)
+        return prefix + "{user_input}" + suffix
+    
+    def render_custom_prompt(self, system_prompt: str, user_input: str) -> str:
+        """Render the custom prompt template for a single user input"""
+        prefix, suffix = self._prompt_template_parts(system_prompt)
+        return prefix + user_input + suffix
 
 # Example tools
 def create_example_tools():
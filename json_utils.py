@@ -0,0 +1,36 @@
+"""
+JSON helpers shared across the project: orjson when installed, stdlib json otherwise
+"""
+
+import json
+from typing import Any
+
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to stdlib json
+    orjson = None
+
+def dumps(obj: Any) -> bytes:
+    """Serialize to compact JSON bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson rejects integers beyond 64 bits, which stdlib json encodes
+            pass
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False).encode()
+
+def loads(data: Any) -> Any:
+    """Deserialize JSON from str or bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+def dumps_indented(obj: Any) -> str:
+    """Serialize to human-readable JSON with two-space indentation"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass
+    return json.dumps(obj, indent=2, ensure_ascii=False)
@@ -6,65 +6,182 @@ This allows the Qwen3 model to use DesktopCommander's enhanced capabilities
 
 import json
 import asyncio
+import itertools
 import logging
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import aiohttp
-from datetime import datetime
+from json_utils import dumps as _dumps, loads as _loads
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# JSON-RPC request ids and the static header sent with pre-encoded bodies
+_rpc_id = itertools.count().__next__
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Session-wide timeout; calls only override it when they need a tighter total
+_DEFAULT_TIMEOUT = aiohttp.ClientTimeout(total=300, connect=5)
+
 class DesktopCommanderBridge:
     """
     Bridge to connect DesktopCommanderMCP capabilities with Qwen3 MCP Server
     """
     
-    def __init__(self, desktop_commander_url: str = "http://desktop-commander:3000"):
+    def __init__(self, desktop_commander_url: str = "http://desktop-commander:3000",
+                 max_batch: int = 16, max_wait_ms: Optional[float] = None):
         self.desktop_commander_url = desktop_commander_url
+        # Built once, keeping any path prefix in the configured URL
+        self._rpc_url = desktop_commander_url.rstrip('/') + '/rpc'
         self.session = None
+        # Calls are coalesced into JSON-RPC batch requests when max_wait_ms is set
+        self.max_batch = max_batch
+        self.max_wait_ms = max_wait_ms
+        self._queue: Optional[asyncio.Queue] = None
+        self._flusher_task: Optional[asyncio.Task] = None
         
     async def initialize(self):
         """Initialize the bridge connection"""
-        self.session = aiohttp.ClientSession()
+        self.session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=50, limit_per_host=20, keepalive_timeout=60),
+            timeout=_DEFAULT_TIMEOUT
+        )
+        if self.max_wait_ms is not None:
+            self._queue = asyncio.Queue()
+            self._flusher_task = asyncio.create_task(self._flusher())
         
     async def close(self):
-        """Close the bridge connection"""
+        """Close the bridge connection, failing any calls still waiting for a batch"""
+        if self._flusher_task:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+            self._flusher_task = None
+            # Calls queued behind the cancelled flusher would otherwise wait forever
+            while not self._queue.empty():
+                _, _, future = self._queue.get_nowait()
+                if not future.done():
+                    future.set_exception(ConnectionError("DesktopCommander bridge closed"))
+            self._queue = None
         if self.session:
             await self.session.close()
     
+    async def _rpc(self, method: str, params: Dict[str, Any], timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Send a single JSON-RPC call, via the batch queue when batching is enabled"""
+        if self._queue is not None:
+            future = asyncio.get_running_loop().create_future()
+            await self._queue.put((method, params, future))
+            if timeout:
+                return await asyncio.wait_for(future, timeout)
+            return await future
+        
+        payload = {
+            "jsonrpc": "2.0",
+            "method": method,
+            "params": params,
+            "id": _rpc_id()
+        }
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout, connect=5)} if timeout else {}
+        async with self.session.post(
+            self._rpc_url,
+            data=_dumps(payload),
+            headers=_JSON_HEADERS,
+            **kwargs
+        ) as response:
+            # HTTP failures usually carry a non-JSON body, so don't try to parse it
+            if response.status >= 400:
+                return {"error": {"code": response.status, "message": await response.text()}}
+            return _loads(await response.read())
+    
+    async def call_batch(self, calls: List[Tuple[str, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Send several JSON-RPC calls in one batch request, returning responses in call order"""
+        ids = [_rpc_id() for _ in calls]
+        payload = [
+            {"jsonrpc": "2.0", "method": method, "params": params, "id": call_id}
+            for call_id, (method, params) in zip(ids, calls)
+        ]
+        
+        async with self.session.post(
+            self._rpc_url,
+            data=_dumps(payload),
+            headers=_JSON_HEADERS
+        ) as response:
+            if response.status >= 400:
+                results = {"error": {"code": response.status, "message": await response.text()}}
+            else:
+                results = _loads(await response.read())
+        
+        # A single error object means the whole batch was rejected
+        if isinstance(results, dict):
+            results = [dict(results, id=call_id) for call_id in ids]
+        
+        by_id = {result.get("id"): result for result in results}
+        missing = {"error": {"code": -32603, "message": "No response for batched call"}}
+        return [by_id.get(call_id, missing) for call_id in ids]
+    
+    async def _flusher(self):
+        """Drain queued calls and submit them as batches of up to max_batch"""
+        wait = self.max_wait_ms / 1000
+        loop = asyncio.get_running_loop()
+        
+        pending = []
+        try:
+            while True:
+                pending = [await self._queue.get()]
+                deadline = loop.time() + wait
+                while len(pending) < self.max_batch:
+                    remaining = deadline - loop.time()
+                    if remaining <= 0:
+                        break
+                    try:
+                        pending.append(await asyncio.wait_for(self._queue.get(), remaining))
+                    except asyncio.TimeoutError:
+                        break
+                
+                try:
+                    results = await self.call_batch([(method, params) for method, params, _ in pending])
+                except Exception as e:
+                    for _, _, future in pending:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                
+                for (_, _, future), result in zip(pending, results):
+                    if not future.done():
+                        future.set_result(result)
+        except asyncio.CancelledError:
+            # close() cancelled us; fail the batch being collected or in flight
+            for _, _, future in pending:
+                if not future.done():
+                    future.set_exception(ConnectionError("DesktopCommander bridge closed"))
+            raise
+    
     async def execute_command(self, command: str, timeout: Optional[int] = None) -> Dict[str, Any]:
         """Execute a terminal command through DesktopCommander"""
         try:
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "execute_command",
-                "params": {
+            result = await self._rpc(
+                "execute_command",
+                {
                     "command": command,
                     "timeout": timeout or 30
                 },
-                "id": f"cmd_{datetime.utcnow().timestamp()}"
-            }
+                timeout=timeout + 10 if timeout else 40
+            )
             
-            async with self.session.post(
-                f"{self.desktop_commander_url}/rpc",
-                json=payload,
-                timeout=aiohttp.ClientTimeout(total=timeout + 10 if timeout else 40)
-            ) as response:
-                result = await response.json()
-                
-                if "error" in result:
-                    return {
-                        "status": "error",
-                        "error": result["error"]["message"],
-                        "code": result["error"]["code"]
-                    }
-                
+            if "error" in result:
                 return {
-                    "status": "success",
-                    "output": result.get("result", {}).get("output", ""),
-                    "exit_code": result.get("result", {}).get("exitCode", 0)
+                    "status": "error",
+                    "error": result["error"]["message"],
+                    "code": result["error"]["code"]
                 }
+            
+            return {
+                "status": "success",
+                "output": result.get("result", {}).get("output", ""),
+                "exit_code": result.get("result", {}).get("exitCode", 0)
+            }
                 
         except asyncio.TimeoutError:
             return {
@@ -81,33 +198,25 @@ class DesktopCommanderBridge:
     async def search_files(self, query: str, path: str = ".", max_results: int = 50) -> Dict[str, Any]:
         """Search files using DesktopCommander's ripgrep integration"""
         try:
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "search_code",
-                "params": {
+            result = await self._rpc(
+                "search_code",
+                {
                     "query": query,
                     "path": path,
                     "maxResults": max_results
-                },
-                "id": f"search_{datetime.utcnow().timestamp()}"
-            }
+                }
+            )
             
-            async with self.session.post(
-                f"{self.desktop_commander_url}/rpc",
-                json=payload
-            ) as response:
-                result = await response.json()
-                
-                if "error" in result:
-                    return {
-                        "status": "error",
-                        "error": result["error"]["message"]
-                    }
-                
+            if "error" in result:
                 return {
-                    "status": "success",
-                    "results": result.get("result", {}).get("results", [])
+                    "status": "error",
+                    "error": result["error"]["message"]
                 }
+            
+            return {
+                "status": "success",
+                "results": result.get("result", {}).get("results", [])
+            }
                 
         except Exception as e:
             logger.error(f"Error searching files: {e}")
@@ -119,34 +228,26 @@ class DesktopCommanderBridge:
     async def edit_file(self, file_path: str, edits: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Edit files using DesktopCommander's advanced editing capabilities"""
         try:
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "edit_files",
-                "params": {
+            result = await self._rpc(
+                "edit_files",
+                {
                     "edits": [{
                         "filePath": file_path,
                         "edits": edits
                     }]
-                },
-                "id": f"edit_{datetime.utcnow().timestamp()}"
-            }
+                }
+            )
             
-            async with self.session.post(
-                f"{self.desktop_commander_url}/rpc",
-                json=payload
-            ) as response:
-                result = await response.json()
-                
-                if "error" in result:
-                    return {
-                        "status": "error",
-                        "error": result["error"]["message"]
-                    }
-                
+            if "error" in result:
                 return {
-                    "status": "success",
-                    "result": result.get("result", {})
+                    "status": "error",
+                    "error": result["error"]["message"]
                 }
+            
+            return {
+                "status": "success",
+                "result": result.get("result", {})
+            }
                 
         except Exception as e:
             logger.error(f"Error editing file: {e}")
@@ -162,29 +263,18 @@ class DesktopCommanderBridge:
             if process_id:
                 params["processId"] = process_id
             
-            payload = {
-                "jsonrpc": "2.0",
-                "method": "manage_process",
-                "params": params,
-                "id": f"process_{datetime.utcnow().timestamp()}"
-            }
+            result = await self._rpc("manage_process", params)
             
-            async with self.session.post(
-                f"{self.desktop_commander_url}/rpc",
-                json=payload
-            ) as response:
-                result = await response.json()
-                
-                if "error" in result:
-                    return {
-                        "status": "error",
-                        "error": result["error"]["message"]
-                    }
-                
+            if "error" in result:
                 return {
-                    "status": "success",
-                    "result": result.get("result", {})
+                    "status": "error",
+                    "error": result["error"]["message"]
                 }
+            
+            return {
+                "status": "success",
+                "result": result.get("result", {})
+            }
                 
         except Exception as e:
             logger.error(f"Error managing process: {e}")
@@ -7,17 +7,28 @@ Provides WebSocket and HTTP endpoints for MCP protocol
 import asyncio
 import json
 import logging
-import os
-from typing import Dict, Any, Optional
-from datetime import datetime
+import re
+import signal
+import socket
+import time
+from typing import Dict, Any, Optional, Set
+from datetime import datetime, timezone
 import aiohttp
 from aiohttp import web
-import weakref
+from collections import deque
+
+import msgspec
+
+try:
+    import uvloop
+except ImportError:  # uvloop is unavailable on Windows; use the stock event loop
+    uvloop = None
 
 from dotenv import load_dotenv
-from mcp_server import MCPServer
-from fine_tune import QwenFineTuner, Tool
+from mcp_server import MCPServer, MCPRequest, MCPError, _decode_request, _VALIDATION_ERRORS, _DECODE_ERRORS
+from fine_tune import QwenFineTuner, Tool, OPENROUTER_API_KEY
 from tool_implementations import ToolExecutor, TOOL_DEFINITIONS
+from json_utils import dumps as _dumps, loads as _loads
 
 # Load environment variables
 load_dotenv()
@@ -26,83 +37,281 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# WebSocket subprotocols; clients negotiating mcp.msgpack exchange MessagePack binary frames
+MSGPACK_SUBPROTOCOL = "mcp.msgpack"
+JSON_SUBPROTOCOL = "mcp.json"
+
+_WS_PROTOCOLS = (MSGPACK_SUBPROTOCOL, JSON_SUBPROTOCOL)
+_msgpack_encoder = msgspec.msgpack.Encoder()
+# Typed decoder that builds MCPRequest objects directly and validates field
+# types, raising the same errors as mcp_server's JSON _decode_request
+_msgpack_request_decoder = msgspec.msgpack.Decoder(MCPRequest)
+
+# Raised when a message cannot be represented on the wire, such as an integer
+# beyond 64 bits in MessagePack
+_ENCODE_ERRORS = (TypeError, ValueError, OverflowError)
+
+def _encode_frame(data: Any, binary: bool):
+    """Encode a message as a MessagePack (bytes) or JSON (str) WebSocket frame"""
+    if binary:
+        return _msgpack_encoder.encode(data)
+    return _dumps(data).decode()
+
+def _json_response(data: Any, status: int = 200) -> web.Response:
+    """Build a JSON HTTP response from pre-encoded bytes"""
+    return web.Response(body=_dumps(data), status=status, content_type="application/json")
+
+def _error_envelope(code: int, message: str, error: Exception, request_id: Any = None) -> Dict[str, Any]:
+    """Build a JSON-RPC error response carrying the exception text as data"""
+    return {
+        "jsonrpc": "2.0",
+        "error": {
+            "code": code,
+            "message": message,
+            "data": str(error)
+        },
+        "id": request_id
+    }
+
+# Canned mock replies, keyed by trigger keyword in priority order
+_MOCK_RESPONSES = {
+    "weather": "Based on the available data, the weather in the requested location is currently partly cloudy with moderate temperatures.",
+    "calculate": "I can help you with calculations. Please provide the mathematical expression you'd like me to evaluate.",
+    "code": "I can help you write code. Please specify the programming language and the task you'd like to accomplish.",
+}
+_MOCK_KEYWORDS = tuple(_MOCK_RESPONSES)
+_MOCK_PATTERN = re.compile("|".join(_MOCK_KEYWORDS), re.IGNORECASE)
+
+# Tool names reported by /api/v1/info
+_TOOL_NAMES = [tool["name"] for tool in TOOL_DEFINITIONS]
+
+# Static index page, encoded once at import
+_INDEX_HTML = """\
+<!DOCTYPE html>
+<html>
+<head>
+    <title>Qwen3 MCP Server</title>
+    <style>
+        body { font-family: Arial, sans-serif; margin: 40px; }
+        .info { background-color: #f0f0f0; padding: 20px; border-radius: 5px; }
+        code { background-color: #e0e0e0; padding: 2px 4px; border-radius: 3px; }
+    </style>
+</head>
+<body>
+    <h1>Qwen3 Model Context Protocol Server</h1>
+    <div class="info">
+        <h2>Endpoints:</h2>
+        <ul>
+            <li><strong>WebSocket MCP:</strong> <code>ws://localhost:8080/mcp</code></li>
+            <li><strong>HTTP API:</strong> <code>POST /api/v1/messages</code></li>
+            <li><strong>Health Check:</strong> <code>GET /api/v1/health</code></li>
+            <li><strong>Server Info:</strong> <code>GET /api/v1/info</code></li>
+        </ul>
+        <h2>MCP Protocol Version:</h2>
+        <p>2025-06-18</p>
+    </div>
+</body>
+</html>
+"""
+_INDEX_BYTES = _INDEX_HTML.encode("utf-8")
+
+# Outbox bounds per WebSocket connection. handle_websocket stops reading requests
+# until the outbox drains once it holds _OUTBOX_HIGH_WATER frames; a client that
+# lets broadcasts pile up to _OUTBOX_LIMIT frames is disconnected.
+_OUTBOX_HIGH_WATER = 64
+_OUTBOX_LIMIT = 1024
+
+class _WebSocketWriter:
+    """Outbox for one WebSocket connection, drained by a single writer task"""
+    
+    __slots__ = ("ws", "binary", "_outbox", "_ready", "_drained", "_task")
+    
+    def __init__(self, ws: web.WebSocketResponse):
+        self.ws = ws
+        self.binary = ws.ws_protocol == MSGPACK_SUBPROTOCOL
+        self._outbox = deque()
+        self._ready: Optional[asyncio.Future] = None
+        self._drained: Optional[asyncio.Future] = None
+        self._task = asyncio.create_task(self._run())
+    
+    @property
+    def backlogged(self) -> bool:
+        """True once enough frames are queued that the sender should wait for drain()"""
+        return len(self._outbox) >= _OUTBOX_HIGH_WATER
+    
+    def send(self, frame):
+        """Queue an encoded frame (bytes for binary, str for text) without awaiting"""
+        if self._task.done() or self._task.cancelling():
+            # The writer has stopped and the connection is closing; nobody would send it
+            return
+        if len(self._outbox) >= _OUTBOX_LIMIT:
+            logger.warning("Closing WebSocket: client stopped reading with %d frames queued", len(self._outbox))
+            self._outbox.clear()
+            self._task.cancel()
+            return
+        self._outbox.append(frame)
+        if self._ready is not None and not self._ready.done():
+            self._ready.set_result(None)
+    
+    async def drain(self):
+        """Wait until every queued frame has been sent or the writer has stopped"""
+        if not self._outbox or self._task.done() or self._task.cancelling():
+            return
+        if self._drained is None or self._drained.done():
+            self._drained = asyncio.get_running_loop().create_future()
+        await self._drained
+    
+    def encode_and_send(self, data: Dict[str, Any]):
+        """Encode a message in this connection's wire format and queue it"""
+        try:
+            frame = _encode_frame(data, self.binary)
+        except _ENCODE_ERRORS as e:
+            # Answer with an error rather than letting the handler drop the connection
+            logger.error("Error encoding response: %s", e)
+            frame = _encode_frame(
+                _error_envelope(MCPError.INTERNAL_ERROR, "Internal error", e, data.get("id")),
+                self.binary
+            )
+        self.send(frame)
+    
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        ws = self.ws
+        outbox = self._outbox
+        try:
+            while True:
+                while outbox:
+                    frame = outbox.popleft()
+                    if isinstance(frame, bytes):
+                        await ws.send_bytes(frame)
+                    else:
+                        await ws.send_str(frame)
+                self._wake_drained()
+                self._ready = loop.create_future()
+                await self._ready
+        except Exception as e:
+            logger.warning("WebSocket writer stopped: %s", e)
+        finally:
+            # Nothing will send what is left, so drop it, release drain() and
+            # close the connection, which also ends handle_websocket's read loop
+            outbox.clear()
+            self._wake_drained()
+            if not ws.closed:
+                await ws.close()
+    
+    def _wake_drained(self):
+        if self._drained is not None and not self._drained.done():
+            self._drained.set_result(None)
+    
+    async def close(self):
+        """Stop the writer task, dropping any unsent frames"""
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
 class MCPWebSocketHandler:
     """Handles WebSocket connections for MCP protocol"""
     
+    __slots__ = ("mcp_server", "qwen_integration", "_websockets")
+    
     def __init__(self, mcp_server: MCPServer, qwen_integration: 'QwenMCPIntegration'):
         self.mcp_server = mcp_server
         self.qwen_integration = qwen_integration
-        self._websockets = weakref.WeakSet()
+        # Writers are added/removed explicitly by handle_websocket, so no weak references needed
+        self._websockets: Set[_WebSocketWriter] = set()
     
     async def handle_websocket(self, request):
         """Handle WebSocket connection"""
-        ws = web.WebSocketResponse()
+        ws = web.WebSocketResponse(protocols=_WS_PROTOCOLS)
         await ws.prepare(request)
-        self._websockets.add(ws)
+        writer = _WebSocketWriter(ws)
+        self._websockets.add(writer)
+        use_msgpack = writer.binary
         
         try:
             async for msg in ws:
-                if msg.type == aiohttp.WSMsgType.TEXT:
-                    try:
-                        # Parse the request
-                        request_data = json.loads(msg.data)
-                        logger.info(f"Received request: {request_data.get('method', 'unknown')}")
-                        
-                        # Process through MCP server
-                        response = await self.mcp_server.handle_request(request_data)
-                        
-                        # Send response
-                        await ws.send_json(response)
-                        
-                    except json.JSONDecodeError as e:
-                        error_response = {
-                            "jsonrpc": "2.0",
-                            "error": {
-                                "code": -32700,
-                                "message": "Parse error",
-                                "data": str(e)
-                            },
-                            "id": None
-                        }
-                        await ws.send_json(error_response)
-                    except Exception as e:
-                        logger.error(f"Error processing request: {e}")
-                        error_response = {
-                            "jsonrpc": "2.0",
-                            "error": {
-                                "code": -32603,
-                                "message": "Internal error",
-                                "data": str(e)
-                            },
-                            "id": request_data.get("id") if 'request_data' in locals() else None
-                        }
-                        await ws.send_json(error_response)
+                # JSON clients may send BINARY frames to skip aiohttp's UTF-8 text validation;
+                # the JSON decoder validates the bytes itself
+                if msg.type == aiohttp.WSMsgType.TEXT or msg.type == aiohttp.WSMsgType.BINARY:
+                    response = await self._process_frame(
+                        msg.data, use_msgpack and msg.type == aiohttp.WSMsgType.BINARY
+                    )
+                    writer.encode_and_send(response)
+                    if writer.backlogged:
+                        # The client is not reading its responses; stop reading its requests
+                        await writer.drain()
                         
                 elif msg.type == aiohttp.WSMsgType.ERROR:
-                    logger.error(f'WebSocket error: {ws.exception()}')
+                    logger.error('WebSocket error: %s', ws.exception())
                     
         except Exception as e:
-            logger.error(f"WebSocket handler error: {e}")
+            logger.error("WebSocket handler error: %s", e)
         finally:
-            self._websockets.discard(ws)
+            self._websockets.discard(writer)
+            await writer.close()
             return ws
     
+    async def _process_frame(self, data, msgpack_frame: bool) -> Dict[str, Any]:
+        """Decode one inbound frame and return the JSON-RPC response for it"""
+        try:
+            if msgpack_frame:
+                request_data = _msgpack_request_decoder.decode(data)
+            else:
+                request_data = _decode_request(data)
+        except _VALIDATION_ERRORS as e:
+            return _error_envelope(MCPError.INVALID_REQUEST, "Invalid Request", e)
+        except _DECODE_ERRORS as e:
+            return _error_envelope(MCPError.PARSE_ERROR, "Parse error", e)
+        
+        request_id = None
+        try:
+            if isinstance(request_data, MCPRequest):
+                method, request_id = request_data.method, request_data.id
+            else:
+                method, request_id = request_data.get("method", "unknown"), request_data.get("id")
+            if logger.isEnabledFor(logging.INFO):
+                logger.info("Received request: %s", method)
+            
+            # Process through MCP server
+            return await self.mcp_server.handle_request(request_data)
+        except Exception as e:
+            logger.error("Error processing request: %s", e)
+            return _error_envelope(MCPError.INTERNAL_ERROR, "Internal error", e, request_id)
+    
     async def broadcast_notification(self, notification: Dict[str, Any]):
         """Broadcast notification to all connected clients"""
-        if self._websockets:
-            await asyncio.gather(
-                *[ws.send_json(notification) for ws in self._websockets],
-                return_exceptions=True
-            )
+        writers = tuple(self._websockets)
+        if not writers:
+            return
+        
+        # Encode once per wire format, then hand the frame to each connection's writer
+        # (None marks a format the notification cannot be encoded in)
+        frames = {}
+        for writer in writers:
+            if writer.binary not in frames:
+                try:
+                    frames[writer.binary] = _encode_frame(notification, writer.binary)
+                except _ENCODE_ERRORS as e:
+                    logger.error("Error encoding notification: %s", e)
+                    frames[writer.binary] = None
+            frame = frames[writer.binary]
+            if frame is not None:
+                writer.send(frame)
 
 class QwenMCPIntegration:
     """Integration layer between Qwen3 model and MCP server"""
     
+    __slots__ = ("qwen_fine_tuner", "tool_executor", "openrouter_api_key", "is_initialized", "_model_available")
+    
     def __init__(self):
         self.qwen_fine_tuner = None
         self.tool_executor = ToolExecutor()
-        self.openrouter_api_key = os.getenv("OPENROUTER_API_KEY")
+        self.openrouter_api_key = OPENROUTER_API_KEY
         self.is_initialized = False
+        # True once initialized with an API key; checked on every create_message
+        self._model_available = False
         
     def initialize(self):
         """Initialize the Qwen integration"""
@@ -113,30 +322,33 @@ class QwenMCPIntegration:
             self.qwen_fine_tuner = QwenFineTuner(self.openrouter_api_key)
             
             # Register all tools
-            for tool_def in TOOL_DEFINITIONS:
-                tool = Tool(
-                    name=tool_def["name"],
-                    description=tool_def["description"],
-                    parameters=tool_def["parameters"]
-                )
-                self.qwen_fine_tuner.add_tool(tool)
+            self.qwen_fine_tuner.add_tools(Tool(**tool_def) for tool_def in TOOL_DEFINITIONS)
             
             self.is_initialized = True
             logger.info("Qwen integration initialized successfully")
         except Exception as e:
-            logger.error(f"Failed to initialize Qwen integration: {e}")
+            logger.error("Failed to initialize Qwen integration: %s", e)
             self.is_initialized = False
+        
+        self._model_available = self.is_initialized and bool(self.openrouter_api_key)
+    
+    async def close(self):
+        """Release the model client's HTTP sessions"""
+        if self.qwen_fine_tuner is not None:
+            await self.qwen_fine_tuner.aclose()
+            self.qwen_fine_tuner.close()
     
     async def create_message(self, messages: list, model_preferences: dict = None, max_tokens: int = 1000) -> Dict[str, Any]:
         """Create a message using the Qwen model"""
-        if not self.is_initialized or not self.openrouter_api_key:
+        if not self._model_available:
             # Return mock response if not initialized
             return self._create_mock_response(messages)
         
         try:
             # Extract the last user message
             user_message = ""
-            for msg in reversed(messages):
+            for i in range(len(messages) - 1, -1, -1):
+                msg = messages[i]
                 if msg.get("role") == "user":
                     content = msg.get("content", {})
                     if isinstance(content, dict):
@@ -146,7 +358,7 @@ class QwenMCPIntegration:
                     break
             
             # Call the Qwen model through OpenRouter
-            response = self.qwen_fine_tuner.test_model_with_tools(user_message)
+            response = await self.qwen_fine_tuner.atest_model_with_tools(user_message)
             
             if "choices" in response and len(response["choices"]) > 0:
                 choice = response["choices"][0]
@@ -160,8 +372,8 @@ class QwenMCPIntegration:
                     # Execute tools
                     for call in tool_calls:
                         function_name = call["function"]["name"]
-                        arguments = json.loads(call["function"]["arguments"])
-                        result = self.tool_executor.execute(function_name, arguments)
+                        arguments = _loads(call["function"]["arguments"])
+                        result = await self.tool_executor.aexecute(function_name, arguments)
                         tool_results.append(result)
                     
                     # Combine results
@@ -182,7 +394,7 @@ class QwenMCPIntegration:
                 raise Exception("No response from model")
                 
         except Exception as e:
-            logger.error(f"Error creating message: {e}")
+            logger.error("Error creating message: %s", e)
             return self._create_mock_response(messages)
     
     def _create_mock_response(self, messages: list) -> Dict[str, Any]:
@@ -191,15 +403,11 @@ class QwenMCPIntegration:
         content = last_message.get("content", {})
         text = content.get("text", "") if isinstance(content, dict) else str(content)
         
-        # Simple pattern matching for mock responses
-        response_text = "I understand your request"
+        # Simple pattern matching for mock responses; one scan, keywords ranked by priority
+        found = {match.lower() for match in _MOCK_PATTERN.findall(text)}
         
-        if "weather" in text.lower():
-            response_text = "Based on the available data, the weather in the requested location is currently partly cloudy with moderate temperatures."
-        elif "calculate" in text.lower():
-            response_text = "I can help you with calculations. Please provide the mathematical expression you'd like me to evaluate."
-        elif "code" in text.lower():
-            response_text = "I can help you write code. Please specify the programming language and the task you'd like to accomplish."
+        if found:
+            response_text = _MOCK_RESPONSES[next(k for k in _MOCK_KEYWORDS if k in found)]
         else:
             response_text = f"I received your message: '{text[:50]}...'. How can I help you with this?"
         
@@ -232,11 +440,16 @@ class QwenMCPIntegration:
 class MCPApplication:
     """Main application combining MCP server with HTTP/WebSocket endpoints"""
     
+    __slots__ = ("mcp_server", "qwen_integration", "ws_handler", "app", "_health_cache", "_info_bodies", "_stop")
+    
     def __init__(self):
         self.mcp_server = MCPServer()
         self.qwen_integration = QwenMCPIntegration()
         self.ws_handler = MCPWebSocketHandler(self.mcp_server, self.qwen_integration)
         self.app = web.Application()
+        self._health_cache = (0, None, b"")
+        self._info_bodies: Dict[bool, bytes] = {}
+        self._stop = asyncio.Event()
         self._setup_routes()
         
         # Inject Qwen integration into MCP server
@@ -254,7 +467,7 @@ class MCPApplication:
                 messages, model_preferences, max_tokens
             )
         
-        self.mcp_server.handle_sampling_create_message = enhanced_sampling_handler
+        self.mcp_server.register_handler("sampling/createMessage", enhanced_sampling_handler)
     
     def _setup_routes(self):
         """Setup HTTP and WebSocket routes"""
@@ -272,72 +485,61 @@ class MCPApplication:
     async def handle_http_message(self, request):
         """Handle HTTP message creation request"""
         try:
-            data = await request.json()
+            data = _loads(await request.read())
             messages = data.get("messages", [])
             
             result = await self.qwen_integration.create_message(messages)
             
-            return web.json_response({
+            return _json_response({
                 "success": True,
                 "message": result
             })
         except Exception as e:
-            logger.error(f"HTTP message error: {e}")
-            return web.json_response({
+            logger.error("HTTP message error: %s", e)
+            return _json_response({
                 "success": False,
                 "error": str(e)
             }, status=500)
     
     async def handle_health(self, request):
         """Health check endpoint"""
-        return web.json_response({
-            "status": "healthy",
-            "timestamp": datetime.utcnow().isoformat(),
-            "initialized": self.qwen_integration.is_initialized
-        })
+        # Rebuild the body at most once per second (or when initialization state changes)
+        second = int(time.time())
+        initialized = self.qwen_integration.is_initialized
+        cached_second, cached_initialized, body = self._health_cache
+        if second != cached_second or initialized != cached_initialized:
+            body = _dumps({
+                "status": "healthy",
+                "timestamp": datetime.fromtimestamp(second, tz=timezone.utc).isoformat(),
+                "initialized": initialized
+            })
+            self._health_cache = (second, initialized, body)
+        return web.Response(body=body, content_type="application/json")
     
     async def handle_info(self, request):
         """Server information endpoint"""
-        return web.json_response({
-            "server": self.mcp_server.server_info,
-            "tools": [tool["name"] for tool in TOOL_DEFINITIONS],
-            "model": {
-                "name": "qwen3-235b",
-                "provider": "openrouter",
-                "initialized": self.qwen_integration.is_initialized
-            }
-        })
+        # Server info and tool list are static, so the body only varies with initialization state
+        initialized = self.qwen_integration.is_initialized
+        body = self._info_bodies.get(initialized)
+        if body is None:
+            body = self._info_bodies[initialized] = _dumps({
+                "server": self.mcp_server.server_info,
+                "tools": _TOOL_NAMES,
+                "model": {
+                    "name": "qwen3-235b",
+                    "provider": "openrouter",
+                    "initialized": initialized
+                }
+            })
+        return web.Response(body=body, content_type="application/json")
     
     async def handle_index(self, request):
         """Serve a simple index page"""
-        html = """
-        <!DOCTYPE html>
-        <html>
-        <head>
-            <title>Qwen3 MCP Server</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 40px; }
-                .info { background-color: #f0f0f0; padding: 20px; border-radius: 5px; }
-                code { background-color: #e0e0e0; padding: 2px 4px; border-radius: 3px; }
-            </style>
-        </head>
-        <body>
-            <h1>Qwen3 Model Context Protocol Server</h1>
-            <div class="info">
-                <h2>Endpoints:</h2>
-                <ul>
-                    <li><strong>WebSocket MCP:</strong> <code>ws://localhost:8080/mcp</code></li>
-                    <li><strong>HTTP API:</strong> <code>POST /api/v1/messages</code></li>
-                    <li><strong>Health Check:</strong> <code>GET /api/v1/health</code></li>
-                    <li><strong>Server Info:</strong> <code>GET /api/v1/info</code></li>
-                </ul>
-                <h2>MCP Protocol Version:</h2>
-                <p>2025-06-18</p>
-            </div>
-        </body>
-        </html>
-        """
-        return web.Response(text=html, content_type='text/html')
+        return web.Response(body=_INDEX_BYTES, content_type='text/html', charset='utf-8')
+    
+    def stop(self):
+        """Ask a running start() to shut down"""
+        self._stop.set()
     
     async def start(self, host='0.0.0.0', port=8080):
         """Start the application"""
@@ -345,20 +547,32 @@ class MCPApplication:
         self.qwen_integration.initialize()
         
         # Setup application
-        runner = web.AppRunner(self.app)
+        # No per-request access log; the router is frozen by setup()
+        runner = web.AppRunner(self.app, access_log=None)
         await runner.setup()
-        site = web.TCPSite(runner, host, port)
+        site = web.TCPSite(
+            runner, host, port,
+            backlog=4096,
+            reuse_port=hasattr(socket, "SO_REUSEPORT")
+        )
         
-        logger.info(f"Starting MCP server on {host}:{port}")
+        logger.info("Starting MCP server on %s:%s", host, port)
         await site.start()
         
-        # Keep the server running
+        # Keep the server running until stop() or SIGINT/SIGTERM
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, self._stop.set)
+            except NotImplementedError:  # Windows event loops have no signal handlers
+                pass
+        
         try:
-            await asyncio.Future()  # Run forever
-        except KeyboardInterrupt:
+            await self._stop.wait()
             logger.info("Shutting down server...")
         finally:
             await runner.cleanup()
+            await self.qwen_integration.close()
 
 async def main():
     """Main entry point"""
@@ -366,4 +580,7 @@ async def main():
     await app.start()
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
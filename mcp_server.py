@@ -4,15 +4,25 @@ Model Context Protocol (MCP) Server Implementation for Qwen3
 Following MCP Specification 2025-06-18
 """
 
-import json
 import logging
 import asyncio
+import functools
+import inspect
+import os
+import time
 from typing import Dict, Any, List, Optional, Union
-from dataclasses import dataclass, asdict
-from datetime import datetime
-import uuid
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import secrets
 
 from tool_implementations import ToolExecutor, TOOL_DEFINITIONS
+from json_utils import dumps_indented as _dumps_indented
+import msgspec
+
+try:
+    import uvloop
+except ImportError:  # uvloop is unavailable on Windows; use the stock event loop
+    uvloop = None
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -22,6 +32,40 @@ logger = logging.getLogger(__name__)
 MCP_VERSION = "2025-06-18"
 JSONRPC_VERSION = "2.0"
 
+# Second-resolution UTC timestamp, reformatted at most once per second
+_ts_cache = [0, ""]
+
+def _iso_now() -> str:
+    """Current UTC time as an ISO 8601 string with second resolution"""
+    second = int(time.time())
+    if second != _ts_cache[0]:
+        _ts_cache[:] = [second, datetime.fromtimestamp(second, tz=timezone.utc).isoformat()]
+    return _ts_cache[1]
+
+# Tool suggested by the mock sampling handler, keyed by trigger keyword in priority order
+_SAMPLING_TOOL_HINTS = {
+    "weather": ("get_weather", {"location": "San Francisco, CA"}),
+    "calculate": ("calculate", {"expression": "2+2"}),
+}
+
+# Files backing resources/read: uri -> (path, mimeType, message when missing)
+_RESOURCE_FILES = {
+    "mcp://qwen3/training-data": ("training_data.jsonl", "application/json", "Training data not found"),
+    "mcp://qwen3/config": ("config.json", "application/json", "Configuration not found"),
+    "mcp://qwen3/prompt-template": ("prompt_template.txt", "text/plain", "Prompt template not found"),
+}
+
+@functools.lru_cache(maxsize=8)
+def _load_resource(path: str, mtime_ns: int) -> str:
+    """Read a resource file's text; callers key on mtime so edits invalidate the entry"""
+    with open(path, "rb") as f:
+        if path.endswith(".jsonl"):
+            # Each line is already a JSON document, so splice the raw
+            # lines into an array instead of parsing and re-encoding them
+            body = b",".join(line.strip() for line in f if not line.isspace())
+            return (b"[" + body + b"]").decode()
+        return f.read().decode()
+
 @dataclass
 class MCPError:
     """MCP Error structure"""
@@ -36,21 +80,19 @@ class MCPError:
     INVALID_PARAMS = -32602
     INTERNAL_ERROR = -32603
 
-@dataclass
-class MCPRequest:
+class MCPRequest(msgspec.Struct):
     """MCP Request structure"""
     jsonrpc: str
     method: str
     params: Optional[Dict[str, Any]] = None
     id: Optional[Union[str, int]] = None
 
-@dataclass
-class MCPResponse:
-    """MCP Response structure"""
-    jsonrpc: str = JSONRPC_VERSION
-    id: Optional[Union[str, int]] = None
-    result: Optional[Any] = None
-    error: Optional[Dict[str, Any]] = None
+# Decodes raw JSON straight into a validated MCPRequest. Well-formed input that
+# is not a valid request raises a ValidationError, which subclasses DecodeError,
+# so catch _VALIDATION_ERRORS first.
+_decode_request = msgspec.json.Decoder(MCPRequest).decode
+_VALIDATION_ERRORS = (msgspec.ValidationError,)
+_DECODE_ERRORS = (msgspec.DecodeError,)
 
 @dataclass
 class MCPNotification:
@@ -91,6 +133,103 @@ class MCPServer:
         self.resources = {}
         self.prompts = self._initialize_prompts()
         
+        # Prompt text templates with argument defaults, and the prompts/list response, computed once
+        self._prompt_templates = {
+            "weather_check": ("What's the weather like in {location}?", {"location": "Unknown"}),
+            "code_generation": ("Write {language} code to {task}", {"language": "Python", "task": ""}),
+            "calculation": ("Calculate: {expression}", {"expression": ""}),
+        }
+        prompts_list = [
+            {
+                "name": prompt_data["name"],
+                "description": prompt_data["description"],
+                "arguments": list(prompt_data["arguments"].keys())
+            }
+            for prompt_data in self.prompts.values()
+        ]
+        self._prompts_list_response = {
+            "prompts": prompts_list,
+            "_meta": {
+                "total": len(prompts_list)
+            }
+        }
+        
+        # tools/list and resources/list never change, so build them once
+        tools = [
+            {
+                "name": tool_def["name"],
+                "description": tool_def["description"],
+                "inputSchema": tool_def["parameters"]
+            }
+            for tool_def in TOOL_DEFINITIONS
+        ]
+        self._tools_list_response = {
+            "tools": tools,
+            "_meta": {
+                "total": len(tools)
+            }
+        }
+        resources = [
+            {
+                "uri": "mcp://qwen3/training-data",
+                "name": "Training Data",
+                "mimeType": "application/json",
+                "description": "Fine-tuning training data"
+            },
+            {
+                "uri": "mcp://qwen3/config",
+                "name": "Configuration",
+                "mimeType": "application/json",
+                "description": "Model configuration"
+            },
+            {
+                "uri": "mcp://qwen3/prompt-template",
+                "name": "Prompt Template",
+                "mimeType": "text/plain",
+                "description": "Custom prompt template"
+            }
+        ]
+        self._resources_list_response = {
+            "resources": resources,
+            "_meta": {
+                "total": len(resources)
+            }
+        }
+        
+        # Method dispatch table, built once per server as
+        # method -> (handler, is_async)
+        handlers = {
+            # Base protocol methods
+            "initialize": self.handle_initialize,
+            "ping": self.handle_ping,
+            "shutdown": self.handle_shutdown,
+            
+            # Tool methods
+            "tools/list": self.handle_tools_list,
+            "tools/call": self.handle_tools_call,
+            
+            # Prompt methods
+            "prompts/list": self.handle_prompts_list,
+            "prompts/get": self.handle_prompts_get,
+            
+            # Resource methods
+            "resources/list": self.handle_resources_list,
+            "resources/read": self.handle_resources_read,
+            "resources/subscribe": self.handle_resources_subscribe,
+            "resources/unsubscribe": self.handle_resources_unsubscribe,
+            
+            # Sampling methods
+            "sampling/createMessage": self.handle_sampling_create_message,
+            
+            # Completion methods
+            "completion/complete": self.handle_completion_complete,
+        }
+        self._dispatch = {}
+        for method, handler in handlers.items():
+            self.register_handler(method, handler)
+        # tools/call dominates traffic; handle_request calls it directly until it is replaced
+        self._tools_call_fast_path = True
+        
     def _initialize_prompts(self) -> Dict[str, Any]:
         """Initialize available prompts"""
         return {
@@ -134,11 +273,30 @@ class MCPServer:
             }
         }
     
-    async def handle_request(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Handle incoming MCP request"""
+    def register_handler(self, method: str, handler):
+        """Register or replace the handler (plain function or coroutine function) for an MCP method"""
+        self._dispatch[method] = (handler, inspect.iscoroutinefunction(handler))
+        if method == "tools/call":
+            self._tools_call_fast_path = False
+    
+    async def handle_request(self, request_data: Union[bytes, str, Dict[str, Any], MCPRequest]) -> Dict[str, Any]:
+        """Handle incoming MCP request: raw JSON, a parsed dict or an already-decoded MCPRequest"""
+        request_id = None
         try:
             # Parse request
-            request = MCPRequest(**request_data)
+            if isinstance(request_data, MCPRequest):
+                request = request_data
+            elif isinstance(request_data, (bytes, str)):
+                try:
+                    request = _decode_request(request_data)
+                except _VALIDATION_ERRORS as e:
+                    return self._error_response(MCPError.INVALID_REQUEST, f"Invalid Request: {e}")
+                except _DECODE_ERRORS as e:
+                    return self._error_response(MCPError.PARSE_ERROR, f"Parse error: {e}")
+            else:
+                request_id = request_data.get("id")
+                request = MCPRequest(**request_data)
+            request_id = request.id
             
             # Validate JSON-RPC version
             if request.jsonrpc != JSONRPC_VERSION:
@@ -148,80 +306,59 @@ class MCPServer:
                     request.id
                 )
             
-            # Route to appropriate handler
-            method_handlers = {
-                # Base protocol methods
-                "initialize": self.handle_initialize,
-                "ping": self.handle_ping,
-                "shutdown": self.handle_shutdown,
-                
-                # Tool methods
-                "tools/list": self.handle_tools_list,
-                "tools/call": self.handle_tools_call,
-                
-                # Prompt methods
-                "prompts/list": self.handle_prompts_list,
-                "prompts/get": self.handle_prompts_get,
-                
-                # Resource methods
-                "resources/list": self.handle_resources_list,
-                "resources/read": self.handle_resources_read,
-                "resources/subscribe": self.handle_resources_subscribe,
-                "resources/unsubscribe": self.handle_resources_unsubscribe,
-                
-                # Sampling methods
-                "sampling/createMessage": self.handle_sampling_create_message,
-                
-                # Completion methods
-                "completion/complete": self.handle_completion_complete,
-            }
+            # Fast path for the most common method
+            if request.method == "tools/call" and self._tools_call_fast_path:
+                result = await self.handle_tools_call(request.params or {})
+                return {"jsonrpc": JSONRPC_VERSION, "id": request.id, "result": result}
             
-            handler = method_handlers.get(request.method)
-            if not handler:
+            # Route to appropriate handler
+            entry = self._dispatch.get(request.method)
+            if entry is None:
                 return self._error_response(
                     MCPError.METHOD_NOT_FOUND,
                     f"Method '{request.method}' not found",
                     request.id
                 )
             
-            # Execute handler
-            result = await handler(request.params or {})
+            # Execute handler; synchronous handlers are called without a coroutine
+            handler, is_async = entry
+            result = handler(request.params or {})
+            if is_async:
+                result = await result
             
-            # Return response
-            return asdict(MCPResponse(
-                id=request.id,
-                result=result
-            ))
+            # Return response (built directly; JSON-RPC success responses carry no "error" member)
+            return {"jsonrpc": JSONRPC_VERSION, "id": request.id, "result": result}
             
         except Exception as e:
             logger.error(f"Error handling request: {e}")
             return self._error_response(
                 MCPError.INTERNAL_ERROR,
                 str(e),
-                request_data.get("id")
+                request_id
             )
     
     def _error_response(self, code: int, message: str, request_id: Optional[Union[str, int]] = None) -> Dict[str, Any]:
         """Create error response"""
-        return asdict(MCPResponse(
-            id=request_id,
-            error={
+        return {
+            "jsonrpc": JSONRPC_VERSION,
+            "id": request_id,
+            "error": {
                 "code": code,
                 "message": message
             }
-        ))
+        }
     
-    async def handle_initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_initialize(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Handle initialize request"""
         client_info = params.get("clientInfo", {})
         
         # Create session
-        session_id = str(uuid.uuid4())
+        session_id = secrets.token_hex(16)
         self.sessions[session_id] = {
             "id": session_id,
             "clientInfo": client_info,
-            "createdAt": datetime.utcnow().isoformat(),
-            "subscriptions": []
+            "createdAt": _iso_now(),
+            "subscriptions": set()
         }
         
         return {
@@ -230,32 +367,19 @@ class MCPServer:
             "instructions": "Qwen3 MCP Server ready. Use tools for weather, calculations, code execution, and more."
         }
     
-    async def handle_ping(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_ping(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Handle ping request"""
         return {"pong": True}
     
-    async def handle_shutdown(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_shutdown(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Handle shutdown request"""
         # Clean up sessions
         self.sessions.clear()
         return {"success": True}
     
-    async def handle_tools_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_tools_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """List available tools"""
-        tools = []
-        for tool_def in TOOL_DEFINITIONS:
-            tools.append({
-                "name": tool_def["name"],
-                "description": tool_def["description"],
-                "inputSchema": tool_def["parameters"]
-            })
-        
-        return {
-            "tools": tools,
-            "_meta": {
-                "total": len(tools)
-            }
-        }
+        return self._tools_list_response
     
     async def handle_tools_call(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Call a tool"""
@@ -265,8 +389,8 @@ class MCPServer:
         if not tool_name:
             raise ValueError("Tool name is required")
         
-        # Execute tool
-        result = self.tool_executor.execute(tool_name, arguments)
+        # Execute tool off the event loop
+        result = await self.tool_executor.aexecute(tool_name, arguments)
         
         # Format response based on tool result
         if result["status"] == "success":
@@ -280,24 +404,11 @@ class MCPServer:
                 "isError": True
             }
     
-    async def handle_prompts_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_prompts_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """List available prompts"""
-        prompts = []
-        for prompt_id, prompt_data in self.prompts.items():
-            prompts.append({
-                "name": prompt_data["name"],
-                "description": prompt_data["description"],
-                "arguments": list(prompt_data["arguments"].keys())
-            })
-        
-        return {
-            "prompts": prompts,
-            "_meta": {
-                "total": len(prompts)
-            }
-        }
+        return self._prompts_list_response
     
-    async def handle_prompts_get(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_prompts_get(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Get a specific prompt"""
         prompt_name = params.get("name")
         arguments = params.get("arguments", {})
@@ -307,38 +418,16 @@ class MCPServer:
         
         prompt = self.prompts[prompt_name]
         
-        # Generate prompt based on type
-        if prompt_name == "weather_check":
-            location = arguments.get("location", "Unknown")
+        # Generate prompt text from the precomputed template
+        template = self._prompt_templates.get(prompt_name)
+        if template is not None:
+            text, defaults = template
             messages = [
                 {
                     "role": "user",
                     "content": {
                         "type": "text",
-                        "text": f"What's the weather like in {location}?"
-                    }
-                }
-            ]
-        elif prompt_name == "code_generation":
-            language = arguments.get("language", "Python")
-            task = arguments.get("task", "")
-            messages = [
-                {
-                    "role": "user",
-                    "content": {
-                        "type": "text",
-                        "text": f"Write {language} code to {task}"
-                    }
-                }
-            ]
-        elif prompt_name == "calculation":
-            expression = arguments.get("expression", "")
-            messages = [
-                {
-                    "role": "user",
-                    "content": {
-                        "type": "text",
-                        "text": f"Calculate: {expression}"
+                        "text": text.format_map({**defaults, **arguments})
                     }
                 }
             ]
@@ -350,115 +439,52 @@ class MCPServer:
             "messages": messages
         }
     
-    async def handle_resources_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_resources_list(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """List available resources"""
-        resources = [
-            {
-                "uri": "mcp://qwen3/training-data",
-                "name": "Training Data",
-                "mimeType": "application/json",
-                "description": "Fine-tuning training data"
-            },
-            {
-                "uri": "mcp://qwen3/config",
-                "name": "Configuration",
-                "mimeType": "application/json",
-                "description": "Model configuration"
-            },
-            {
-                "uri": "mcp://qwen3/prompt-template",
-                "name": "Prompt Template",
-                "mimeType": "text/plain",
-                "description": "Custom prompt template"
-            }
-        ]
-        
-        return {
-            "resources": resources,
-            "_meta": {
-                "total": len(resources)
-            }
-        }
+        return self._resources_list_response
     
     async def handle_resources_read(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Read a resource"""
         uri = params.get("uri")
         
-        if uri == "mcp://qwen3/training-data":
-            # Read training data
-            try:
-                with open("training_data.jsonl", "r") as f:
-                    contents = []
-                    for line in f:
-                        contents.append(json.loads(line.strip()))
-                return {
-                    "contents": [
-                        {
-                            "uri": uri,
-                            "mimeType": "application/json",
-                            "text": json.dumps(contents, indent=2)
-                        }
-                    ]
-                }
-            except FileNotFoundError:
-                raise ValueError("Training data not found")
-                
-        elif uri == "mcp://qwen3/config":
-            # Read config
-            try:
-                with open("config.json", "r") as f:
-                    config = json.load(f)
-                return {
-                    "contents": [
-                        {
-                            "uri": uri,
-                            "mimeType": "application/json",
-                            "text": json.dumps(config, indent=2)
-                        }
-                    ]
-                }
-            except FileNotFoundError:
-                raise ValueError("Configuration not found")
-                
-        elif uri == "mcp://qwen3/prompt-template":
-            # Read prompt template
-            try:
-                with open("prompt_template.txt", "r") as f:
-                    template = f.read()
-                return {
-                    "contents": [
-                        {
-                            "uri": uri,
-                            "mimeType": "text/plain",
-                            "text": template
-                        }
-                    ]
-                }
-            except FileNotFoundError:
-                raise ValueError("Prompt template not found")
-        
-        else:
+        resource = _RESOURCE_FILES.get(uri)
+        if resource is None:
             raise ValueError(f"Resource '{uri}' not found")
+        path, mime_type, missing_message = resource
+        
+        # Serve from the cache unless the file changed on disk
+        try:
+            text = _load_resource(path, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            raise ValueError(missing_message)
+        
+        return {
+            "contents": [
+                {
+                    "uri": uri,
+                    "mimeType": mime_type,
+                    "text": text
+                }
+            ]
+        }
     
-    async def handle_resources_subscribe(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_resources_subscribe(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Subscribe to resource updates"""
         uri = params.get("uri")
         session_id = params.get("sessionId")
         
         if session_id in self.sessions:
-            self.sessions[session_id]["subscriptions"].append(uri)
+            self.sessions[session_id]["subscriptions"].add(uri)
         
         return {"success": True}
     
-    async def handle_resources_unsubscribe(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_resources_unsubscribe(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Unsubscribe from resource updates"""
         uri = params.get("uri")
         session_id = params.get("sessionId")
         
         if session_id in self.sessions:
-            subscriptions = self.sessions[session_id]["subscriptions"]
-            if uri in subscriptions:
-                subscriptions.remove(uri)
+            self.sessions[session_id]["subscriptions"].discard(uri)
         
         return {"success": True}
     
@@ -479,16 +505,11 @@ class MCPServer:
         
         # Simple pattern matching for tool usage
         tool_response = None
-        if "weather" in content.lower():
-            tool_response = {
-                "name": "get_weather",
-                "arguments": {"location": "San Francisco, CA"}
-            }
-        elif "calculate" in content.lower():
-            tool_response = {
-                "name": "calculate",
-                "arguments": {"expression": "2+2"}
-            }
+        lowered = content.lower()
+        for keyword, (name, arguments) in _SAMPLING_TOOL_HINTS.items():
+            if keyword in lowered:
+                tool_response = {"name": name, "arguments": arguments}
+                break
         
         return {
             "role": "assistant",
@@ -500,7 +521,7 @@ class MCPServer:
             "stopReason": "endTurn"
         }
     
-    async def handle_completion_complete(self, params: Dict[str, Any]) -> Dict[str, Any]:
+    def handle_completion_complete(self, params: Dict[str, Any]) -> Dict[str, Any]:
         """Handle completion request"""
         ref = params.get("ref")
         argument = params.get("argument", {})
@@ -537,7 +558,7 @@ class MCPServer:
             params={
                 "uri": uri,
                 "updateType": update_type,
-                "timestamp": datetime.utcnow().isoformat()
+                "timestamp": _iso_now()
             }
         )
         
@@ -560,7 +581,7 @@ async def main():
         },
         "id": 1
     })
-    print("Initialize response:", json.dumps(init_response, indent=2))
+    print("Initialize response:", _dumps_indented(init_response))
     
     # Test tools list
     tools_response = await server.handle_request({
@@ -569,7 +590,10 @@ async def main():
         "params": {},
         "id": 2
     })
-    print("\nTools list response:", json.dumps(tools_response, indent=2))
+    print("\nTools list response:", _dumps_indented(tools_response))
 
 if __name__ == "__main__":
-    asyncio.run(main())
+    if uvloop is not None:
+        uvloop.run(main())
+    else:
+        asyncio.run(main())
@@ -1,13 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify
 import os
 from dotenv import load_dotenv
 from tool_implementations import ToolExecutor
 
+try:
+    import orjson
+except ImportError:  # orjson is optional; fall back to Flask's jsonify
+    orjson = None
+
 # Load environment variables
 load_dotenv()
 
 app = Flask(__name__)
 
+# Shared tool executor, created once at import time
+executor = ToolExecutor()
+
 @app.route('/invoke', methods=['POST'])
 def invoke():
     # Get the request data
@@ -15,11 +23,15 @@ def invoke():
     tool_name = data.get('tool_name')
     arguments = data.get('arguments', {})
     
-    # Initialize tool executor
-    executor = ToolExecutor()
     result = executor.execute(tool_name, arguments)
     
     # Return the result as JSON
+    if orjson is not None:
+        try:
+            return Response(orjson.dumps(result), mimetype='application/json')
+        except TypeError:
+            # orjson rejects integers beyond 64 bits; jsonify encodes them
+            pass
     return jsonify(result)
 
 if __name__ == '__main__':
@@ -27,6 +39,7 @@ if __name__ == '__main__':
     mcp_api_key = os.getenv('MCP_API_KEY', 'your-mcp-api-key')
     mcp_endpoint = os.getenv('MCP_ENDPOINT', 'https://mcp.example.com/api')
     
-    # Run Flask app
+    # Run Flask's development server; in production use
+    # gunicorn -c production/gunicorn_conf.py
     app.run(host='0.0.0.0', port=5000)
 
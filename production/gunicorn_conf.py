@@ -0,0 +1,37 @@
+"""
+Gunicorn configuration for the production tool server
+
+Run from the repository root with:
+    gunicorn -c production/gunicorn_conf.py
+"""
+
+import os
+
+# Serve production/app.py from the repository root, the same working directory
+# as `python production/app.py`, so relative file_operations paths resolve alike
+chdir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+pythonpath = chdir
+wsgi_app = "production.app:app"
+
+bind = os.getenv("BIND", "0.0.0.0:5000")
+
+# CPUs this process may run on; os.cpu_count() reports every host CPU
+# even inside a container limited to a few
+if hasattr(os, "sched_getaffinity"):
+    _cpus = len(os.sched_getaffinity(0))
+else:
+    _cpus = os.cpu_count() or 1
+
+# One process per core (plus spares), each with a thread pool so blocking
+# tool I/O overlaps within a worker. execute_code captures output per call,
+# so threads within a worker can run it concurrently.
+workers = int(os.getenv("WEB_CONCURRENCY", _cpus * 2 + 1))
+threads = int(os.getenv("GUNICORN_THREADS", 8))
+worker_class = "gthread"
+
+# Import the app (and build its ToolExecutor) once before forking
+preload_app = True
+
+keepalive = 75
+timeout = 60
+graceful_timeout = 30
@@ -1,31 +1,37 @@
 import os
-import json
 import asyncio
 from typing import Dict, Any, List
 from dotenv import load_dotenv
 from fine_tune import QwenFineTuner, Tool
 from tool_implementations import ToolExecutor, TOOL_DEFINITIONS
+from json_utils import loads as _loads, dumps_indented as _dumps_indented
 
 # Load environment variables
 load_dotenv()
 
+# Tool definitions are static and Tool is immutable, so build them once and
+# share them (and one executor) across every QwenModelWithTools instance
+_TOOLS = [
+    Tool(
+        name=tool_def["name"],
+        description=tool_def["description"],
+        parameters=tool_def["parameters"]
+    )
+    for tool_def in TOOL_DEFINITIONS
+]
+_SHARED_EXECUTOR = ToolExecutor()
+
 class QwenModelWithTools:
     """
     Wrapper class for using the fine-tuned Qwen model with tool support
     """
     
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, executor: ToolExecutor = None):
         self.fine_tuner = QwenFineTuner(api_key)
-        self.tool_executor = ToolExecutor()
+        self.tool_executor = executor or _SHARED_EXECUTOR
         
         # Register all tools
-        for tool_def in TOOL_DEFINITIONS:
-            tool = Tool(
-                name=tool_def["name"],
-                description=tool_def["description"],
-                parameters=tool_def["parameters"]
-            )
-            self.fine_tuner.add_tool(tool)
+        self.fine_tuner.add_tools(_TOOLS)
     
     def process_tool_calls(self, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Process tool calls and return results"""
@@ -33,7 +39,7 @@ class QwenModelWithTools:
         
         for call in tool_calls:
             function_name = call["function"]["name"]
-            arguments = json.loads(call["function"]["arguments"])
+            arguments = _loads(call["function"]["arguments"])
             
             print(f"\n🔧 Executing tool: {function_name}")
             print(f"   Arguments: {arguments}")
@@ -67,14 +73,14 @@ class QwenModelWithTools:
                     tool_results = self.process_tool_calls(tool_calls)
                     
                     # Format final response
-                    final_response = "Based on the tool execution:\n"
+                    parts = ["Based on the tool execution:\n"]
                     for result in tool_results:
                         if result["result"]["status"] == "success":
-                            final_response += f"- {json.dumps(result['result']['result'], indent=2)}\n"
+                            parts.append(f"- {_dumps_indented(result['result']['result'])}\n")
                         else:
-                            final_response += f"- Error: {result['result']['error']}\n"
+                            parts.append(f"- Error: {result['result']['error']}\n")
                     
-                    return final_response
+                    return "".join(parts)
                 else:
                     # Direct response without tools
                     return choice["message"]["content"]
@@ -4,6 +4,7 @@ Demo script to test tool implementations locally without API calls
 """
 
 from tool_implementations import ToolExecutor, TOOL_DEFINITIONS
+from concurrent.futures import ThreadPoolExecutor
 import json
 
 def main():
@@ -71,14 +72,26 @@ print("First 10 Fibonacci numbers:", fib)
         }
     ]
     
-    # Run each test
-    for i, test in enumerate(test_cases, 1):
+    # Run the tests concurrently. File operations share test_file.txt and the
+    # current directory, so they stay in order within a single lane.
+    results = [None] * len(test_cases)
+    file_ops = [i for i, test in enumerate(test_cases) if test['tool'] == 'file_operations']
+    lanes = [[i] for i, test in enumerate(test_cases) if test['tool'] != 'file_operations']
+    lanes.append(file_ops)
+    
+    def run_lane(lane):
+        for i in lane:
+            results[i] = executor.execute(test_cases[i]['tool'], test_cases[i]['args'])
+    
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(run_lane, lanes))
+    
+    # Report each test in order
+    for i, (test, result) in enumerate(zip(test_cases, results), 1):
         print(f"\n{i}. {test['description']}")
         print(f"   Tool: {test['tool']}")
         print(f"   Args: {json.dumps(test['args'], indent=2)}")
         
-        result = executor.execute(test['tool'], test['args'])
-        
         if result['status'] == 'success':
             print(f"   ✅ Success:")
             print(f"   {json.dumps(result['result'], indent=2)}")
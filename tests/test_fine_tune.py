@@ -0,0 +1,26 @@
+import pytest
+
+from fine_tune import QwenFineTuner
+
+
+def test_create_training_examples_batch_rejects_mismatched_columns():
+    tuner = QwenFineTuner(api_key="test-key")
+    
+    with pytest.raises(ValueError):
+        tuner.create_training_examples_batch(
+            ["first", "second", "third"],
+            ["one", "two", "three"],
+            tool_calls_list=[None]
+        )
+    assert tuner.training_data == []
+    tuner.close()
+
+
+def test_create_training_examples_batch_fills_missing_columns():
+    tuner = QwenFineTuner(api_key="test-key")
+    
+    examples = tuner.create_training_examples_batch(["first", "second"], ["one", "two"])
+    
+    assert len(examples) == 2
+    assert tuner.training_data == examples
+    tuner.close()
@@ -0,0 +1,24 @@
+import asyncio
+import sys
+
+import tool_implementations
+from tool_implementations import ToolExecutor
+
+
+def test_execute_code_concurrent_output_is_per_call(monkeypatch):
+    # Exercise the restricted exec() fallback rather than the Monty sandbox
+    monkeypatch.setattr(tool_implementations, "pydantic_monty", None)
+    executor = ToolExecutor()
+    calls = [
+        ("execute_code", {"code": f"for i in range(200):\n    print({n})\n"})
+        for n in range(8)
+    ]
+    # pytest may have replaced sys.stdout already; it must be left as found
+    stdout = sys.stdout
+    
+    results = asyncio.run(executor.aexecute_many(calls))
+    
+    for n, result in enumerate(results):
+        assert result["status"] == "success"
+        assert result["result"]["output"] == f"{n}\n" * 200
+    assert sys.stdout is stdout
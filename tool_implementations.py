@@ -1,16 +1,300 @@
 import json
 import ast
-import operator
+import inspect
+import base64
+import mmap
+import os
+import re
 import requests
-from typing import Dict, Any, Optional
+from requests.adapters import HTTPAdapter
+from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import subprocess
 import sys
 import io
-from contextlib import redirect_stdout, redirect_stderr
+from contextlib import contextmanager
 import asyncio
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+import ctypes
+import signal
+import threading
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from mcp_desktop_commander_bridge import DesktopCommanderBridge, DESKTOP_COMMANDER_TOOLS
 
+try:
+    import pydantic_monty
+except ImportError:  # Monty is optional; execute_code falls back to restricted exec
+    pydantic_monty = None
+
+# Operators, functions and constants allowed in calculate() expressions
+_SAFE_OPERATORS = frozenset({
+    ast.Add,
+    ast.Sub,
+    ast.Mult,
+    ast.Div,
+    ast.Pow,
+    ast.USub,
+    ast.Mod,
+})
+
+_SAFE_FUNCTIONS = {
+    'abs': abs,
+    'round': round,
+    'min': min,
+    'max': max,
+}
+
+_SAFE_CONSTANTS = {
+    'pi': 3.14159265359,
+    'e': 2.71828182846,
+}
+
+# Validated expressions run with no builtins; only the names above resolve
+_EVAL_GLOBALS = {'__builtins__': {}, **_SAFE_FUNCTIONS, **_SAFE_CONSTANTS}
+
+class ExpressionValidator(ast.NodeVisitor):
+    """Rejects any parsed expression outside the safe arithmetic subset"""
+    
+    def visit(self, node):
+        handler = self._HANDLERS.get(type(node))
+        if handler is None:
+            raise ValueError(f"Unsupported operation: {type(node).__name__}")
+        handler(self, node)
+    
+    def _visit_expression(self, node):
+        self.visit(node.body)
+    
+    def _visit_constant(self, node):
+        if type(node.value) not in (int, float, complex):
+            raise ValueError(f"Unsupported operation: {type(node).__name__}")
+    
+    def _visit_binop(self, node):
+        self._check_operator(node.op)
+        self.visit(node.left)
+        self.visit(node.right)
+    
+    def _visit_unaryop(self, node):
+        self._check_operator(node.op)
+        self.visit(node.operand)
+    
+    def _visit_call(self, node):
+        if isinstance(node.func, ast.Name) and node.func.id in _SAFE_FUNCTIONS:
+            if node.keywords:
+                raise ValueError(f"Keyword arguments are not supported: {node.func.id}")
+            for arg in node.args:
+                self.visit(arg)
+        else:
+            raise ValueError(f"Unsafe function: {getattr(node.func, 'id', type(node.func).__name__)}")
+    
+    def _visit_name(self, node):
+        if node.id not in _SAFE_CONSTANTS:
+            raise ValueError(f"Unknown variable: {node.id}")
+    
+    def _check_operator(self, op):
+        if type(op) not in _SAFE_OPERATORS:
+            raise ValueError(f"Unsupported operator: {type(op).__name__}")
+    
+    # Node type -> check, so visit() dispatches with one dict lookup
+    _HANDLERS = {
+        ast.Expression: _visit_expression,
+        ast.Constant: _visit_constant,
+        ast.BinOp: _visit_binop,
+        ast.UnaryOp: _visit_unaryop,
+        ast.Call: _visit_call,
+        ast.Name: _visit_name,
+    }
+
+@lru_cache(maxsize=4096)
+def _compile_expression(expression: str):
+    """Parse, validate and compile an expression once; repeated expressions reuse the code object"""
+    tree = ast.parse(expression, mode='eval')
+    ExpressionValidator().visit(tree)
+    return compile(tree, '<calculate>', 'eval')
+
+@lru_cache(maxsize=4096)
+def _evaluate_expression(expression: str):
+    """Evaluate an expression once; results are immutable numbers, so they are cached too"""
+    return eval(_compile_expression(expression), _EVAL_GLOBALS)
+
+# Mock weather data for get_weather, keyed by case-folded location
+_MOCK_WEATHER = {
+    location.casefold(): weather
+    for location, weather in {
+        "New York, NY": {"temp_c": 22, "temp_f": 72, "condition": "Partly cloudy", "humidity": 65},
+        "San Francisco, CA": {"temp_c": 18, "temp_f": 64, "condition": "Foggy", "humidity": 80},
+        "London, UK": {"temp_c": 15, "temp_f": 59, "condition": "Rainy", "humidity": 85},
+        "Tokyo, Japan": {"temp_c": 25, "temp_f": 77, "condition": "Clear", "humidity": 60},
+    }.items()
+}
+_DEFAULT_WEATHER = {"temp_c": 20, "temp_f": 68, "condition": "Unknown", "humidity": 50}
+
+# (result number, url) pairs for the five mock search results
+_MOCK_SEARCH_SLOTS = tuple((n, f"https://example.com/result{n}") for n in range(1, 6))
+
+@lru_cache(maxsize=512)
+def _get_timezone(name: str) -> ZoneInfo:
+    """Load a timezone once per name"""
+    return ZoneInfo(name)
+
+# strftime directives that map directly onto datetime attributes
+_STRFTIME_FIELDS = {
+    'Y': '{0.year}',
+    'm': '{0.month:02d}',
+    'd': '{0.day:02d}',
+    'H': '{0.hour:02d}',
+    'M': '{0.minute:02d}',
+    'S': '{0.second:02d}',
+    'f': '{0.microsecond:06d}',
+    '%': '%',
+}
+
+@lru_cache(maxsize=64)
+def _compile_strftime(fmt: str):
+    """Return a formatter for fmt; purely numeric formats become one precompiled str.format call"""
+    template = []
+    for i, piece in enumerate(re.split(r'(%.)', fmt, flags=re.DOTALL)):
+        if i % 2:
+            field = _STRFTIME_FIELDS.get(piece[1])
+            if field is None:
+                # Locale-dependent and less common directives go through strftime itself
+                return lambda dt: dt.strftime(fmt)
+            template.append(field)
+        elif '%' in piece:
+            # A dangling '%' is platform-specific; leave it to strftime too
+            return lambda dt: dt.strftime(fmt)
+        else:
+            template.append(piece.replace('{', '{{').replace('}', '}}'))
+    return ''.join(template).format
+
+# Builtins available to the restricted exec() fallback of execute_code.
+# CPython needs a real dict here (a mapping proxy breaks import statements
+# with a SystemError), so each call gets a copy and code cannot rebind them
+# for later calls. print is supplied per call so output never goes through
+# the process-wide sys.stdout.
+_EXEC_BUILTINS = {
+    'len': len,
+    'range': range,
+    'str': str,
+    'int': int,
+    'float': float,
+    'list': list,
+    'dict': dict,
+    'set': set,
+    'tuple': tuple,
+    'bool': bool,
+    'abs': abs,
+    'min': min,
+    'max': max,
+    'sum': sum,
+    'round': round,
+    'sorted': sorted,
+    'enumerate': enumerate,
+    'zip': zip,
+    'map': map,
+    'filter': filter,
+}
+
+# Text reads at least this large are decoded from an mmap instead of read()
+_MMAP_READ_THRESHOLD = 1 << 20
+
+# Worker threads for running synchronous tools from async callers
+_POOL = ThreadPoolExecutor(max_workers=min(32, (os.cpu_count() or 1) * 4), thread_name_prefix="tool")
+
+# Shared Monty worker pool for execute_code, started on first use
+_monty = None
+_monty_lock = threading.Lock()
+
+def _monty_pool():
+    """Return the shared Monty pool, starting its workers once; they stay warm between calls"""
+    global _monty
+    if _monty is None:
+        with _monty_lock:
+            if _monty is None:
+                pool = pydantic_monty.Monty()
+                pool.__enter__()
+                atexit.register(pool.__exit__, None, None, None)
+                _monty = pool
+    return _monty
+
+# Once a time limit expires, TimeoutError is raised again at this interval
+# until the block exits, in case the code catches it
+_TIMEOUT_REPEAT_SECS = 0.1
+
+@contextmanager
+def _time_limit(seconds: float):
+    """
+    Raise TimeoutError in the calling thread if the block runs longer than seconds.
+    
+    The timeout is an exception raised inside the running code, so it is
+    raised again until the block exits, and once more after it if the code
+    swallowed it. Code that catches BaseException inside an endless loop can
+    still hold its thread forever; only the Monty sandbox can stop that.
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    
+    message = f"Execution timed out after {seconds} seconds"
+    expired = False
+    
+    if hasattr(signal, "setitimer") and threading.current_thread() is threading.main_thread():
+        # POSIX main thread: a kernel interval timer costs nothing until it fires
+        def expire(signum, frame):
+            nonlocal expired
+            expired = True
+            raise TimeoutError(message)
+        
+        previous = signal.signal(signal.SIGALRM, expire)
+        signal.setitimer(signal.ITIMER_REAL, seconds, _TIMEOUT_REPEAT_SECS)
+        try:
+            yield
+        finally:
+            signal.setitimer(signal.ITIMER_REAL, 0)
+            signal.signal(signal.SIGALRM, previous)
+    else:
+        # Windows or worker threads: inject TimeoutError from a watchdog timer
+        thread_id = threading.get_ident()
+        lock = threading.Lock()
+        finished = False
+        timer = None
+        
+        def expire():
+            nonlocal expired, timer
+            with lock:
+                if finished:
+                    return
+                expired = True
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(
+                    ctypes.c_ulong(thread_id), ctypes.py_object(TimeoutError)
+                )
+                timer = threading.Timer(_TIMEOUT_REPEAT_SECS, expire)
+                timer.daemon = True
+                timer.start()
+        
+        with lock:
+            timer = threading.Timer(seconds, expire)
+            timer.daemon = True
+            timer.start()
+        try:
+            yield
+        except TimeoutError as e:
+            if e.args:
+                raise
+            # The injected exception carries no message
+            raise TimeoutError(message) from None
+        finally:
+            with lock:
+                finished = True
+                timer.cancel()
+                # Drop an injected exception that has not been delivered yet
+                ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_ulong(thread_id), None)
+    
+    if expired:
+        # The code caught the timeout and finished anyway
+        raise TimeoutError(message)
+
 class ToolExecutor:
     """Executes tool calls and returns results"""
     
@@ -23,17 +307,35 @@ class ToolExecutor:
             "get_datetime": self.get_datetime,
             "file_operations": self.file_operations
         }
+        # Bound lookup into the same dict, so tools added later are still found
+        self._dispatch = self.tools.get
+        
+        # Pooled keep-alive session for tools that call HTTP APIs
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+    
+    def close(self):
+        """Close the underlying HTTP session"""
+        self._session.close()
     
     def execute(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
         """Execute a tool and return the result"""
-        if tool_name not in self.tools:
+        tool = self._dispatch(tool_name)
+        if tool is None:
             return {
                 "error": f"Unknown tool: {tool_name}",
                 "status": "error"
             }
         
         try:
-            result = self.tools[tool_name](**arguments)
+            shim = _SHIMS.get(tool_name)
+            if shim is not None and getattr(tool, "__func__", None) is shim[0]:
+                # Built-in tool: call through its generated positional shim
+                result = shim[1](self, arguments)
+            else:
+                result = tool(**arguments)
             return {
                 "result": result,
                 "status": "success"
@@ -44,22 +346,27 @@ class ToolExecutor:
                 "status": "error"
             }
     
+    async def aexecute(self, tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute a tool on the shared thread pool so the event loop is never blocked"""
+        return await asyncio.get_running_loop().run_in_executor(_POOL, self.execute, tool_name, arguments)
+    
+    async def aexecute_many(self, calls: List[Tuple[str, Dict[str, Any]]], max_workers: int = 10) -> List[Dict[str, Any]]:
+        """Execute (tool_name, arguments) calls concurrently in worker threads, preserving order"""
+        semaphore = asyncio.Semaphore(max_workers)
+        
+        async def run(tool_name: str, arguments: Dict[str, Any]) -> Dict[str, Any]:
+            async with semaphore:
+                return await self.aexecute(tool_name, arguments)
+        
+        return await asyncio.gather(*(run(tool_name, arguments) for tool_name, arguments in calls))
+    
     def get_weather(self, location: str, unit: str = "celsius") -> Dict[str, Any]:
         """
         Mock weather API - in production, this would call a real weather service
         """
         # This is a mock implementation
         # In production, you'd use a real weather API like OpenWeatherMap
-        mock_weather_data = {
-            "New York, NY": {"temp_c": 22, "temp_f": 72, "condition": "Partly cloudy", "humidity": 65},
-            "San Francisco, CA": {"temp_c": 18, "temp_f": 64, "condition": "Foggy", "humidity": 80},
-            "London, UK": {"temp_c": 15, "temp_f": 59, "condition": "Rainy", "humidity": 85},
-            "Tokyo, Japan": {"temp_c": 25, "temp_f": 77, "condition": "Clear", "humidity": 60},
-        }
-        
-        weather = mock_weather_data.get(location, {
-            "temp_c": 20, "temp_f": 68, "condition": "Unknown", "humidity": 50
-        })
+        weather = _MOCK_WEATHER.get(location.strip().casefold(), _DEFAULT_WEATHER)
         
         temp = weather["temp_c"] if unit == "celsius" else weather["temp_f"]
         unit_symbol = "°C" if unit == "celsius" else "°F"
@@ -75,60 +382,8 @@ class ToolExecutor:
         """
         Safely evaluate mathematical expressions
         """
-        # Define safe operations
-        safe_operators = {
-            ast.Add: operator.add,
-            ast.Sub: operator.sub,
-            ast.Mult: operator.mul,
-            ast.Div: operator.truediv,
-            ast.Pow: operator.pow,
-            ast.USub: operator.neg,
-            ast.Mod: operator.mod,
-        }
-        
-        safe_functions = {
-            'abs': abs,
-            'round': round,
-            'min': min,
-            'max': max,
-        }
-        
-        class MathEvaluator(ast.NodeVisitor):
-            def visit(self, node):
-                if isinstance(node, ast.Expression):
-                    return self.visit(node.body)
-                elif isinstance(node, ast.Num):
-                    return node.n
-                elif isinstance(node, ast.BinOp):
-                    left = self.visit(node.left)
-                    right = self.visit(node.right)
-                    return safe_operators[type(node.op)](left, right)
-                elif isinstance(node, ast.UnaryOp):
-                    operand = self.visit(node.operand)
-                    return safe_operators[type(node.op)](operand)
-                elif isinstance(node, ast.Call):
-                    if isinstance(node.func, ast.Name) and node.func.id in safe_functions:
-                        args = [self.visit(arg) for arg in node.args]
-                        return safe_functions[node.func.id](*args)
-                    else:
-                        raise ValueError(f"Unsafe function: {ast.dump(node.func)}")
-                elif isinstance(node, ast.Name):
-                    if node.id == 'pi':
-                        return 3.14159265359
-                    elif node.id == 'e':
-                        return 2.71828182846
-                    else:
-                        raise ValueError(f"Unknown variable: {node.id}")
-                else:
-                    raise ValueError(f"Unsupported operation: {ast.dump(node)}")
-        
         try:
-            # Parse the expression
-            tree = ast.parse(expression, mode='eval')
-            
-            # Evaluate safely
-            evaluator = MathEvaluator()
-            result = evaluator.visit(tree)
+            result = _evaluate_expression(expression)
             
             return {
                 "expression": expression,
@@ -144,50 +399,30 @@ class ToolExecutor:
         """
         Execute Python code in a sandboxed environment
         """
-        # Create a restricted execution environment
-        restricted_globals = {
-            '__builtins__': {
-                'print': print,
-                'len': len,
-                'range': range,
-                'str': str,
-                'int': int,
-                'float': float,
-                'list': list,
-                'dict': dict,
-                'set': set,
-                'tuple': tuple,
-                'bool': bool,
-                'abs': abs,
-                'min': min,
-                'max': max,
-                'sum': sum,
-                'round': round,
-                'sorted': sorted,
-                'enumerate': enumerate,
-                'zip': zip,
-                'map': map,
-                'filter': filter,
-            }
-        }
+        if pydantic_monty is not None:
+            return self._execute_code_monty(code, timeout)
         
-        # Capture output
+        # Capture output in a per-call buffer; redirecting sys.stdout would
+        # interleave calls running concurrently on other threads
         output_capture = io.StringIO()
-        error_capture = io.StringIO()
+        
+        def captured_print(*args, sep=' ', end='\n', file=None, flush=False):
+            print(*args, sep=sep, end=end, file=output_capture if file is None else file)
+        
+        # Fresh globals and builtins per call so snippets cannot see or
+        # replace each other's names
+        restricted_globals = {'__builtins__': dict(_EXEC_BUILTINS), 'print': captured_print}
         
         try:
-            with redirect_stdout(output_capture), redirect_stderr(error_capture):
+            with _time_limit(timeout):
                 # Execute the code with timeout
                 exec(code, restricted_globals)
             
-            output = output_capture.getvalue()
-            error = error_capture.getvalue()
-            
             return {
                 "code": code,
-                "output": output,
-                "error": error if error else None,
-                "status": "success" if not error else "error"
+                "output": output_capture.getvalue(),
+                "error": None,
+                "status": "success"
             }
         except Exception as e:
             return {
@@ -196,6 +431,31 @@ class ToolExecutor:
                 "status": "error"
             }
     
+    def _execute_code_monty(self, code: str, timeout: int) -> Dict[str, Any]:
+        """
+        Execute Python code in a Monty sandbox worker, enforcing the timeout
+        """
+        streams = pydantic_monty.CollectStreams()
+        try:
+            with _monty_pool().checkout(limits={"max_feed_duration_secs": timeout}) as session:
+                session.feed_run(code, print_callback=streams)
+        except pydantic_monty.MontyError as e:
+            return {
+                "code": code,
+                "error": str(e),
+                "status": "error"
+            }
+        
+        output = "".join(text for stream, text in streams.output if stream == "stdout")
+        error = "".join(text for stream, text in streams.output if stream == "stderr")
+        
+        return {
+            "code": code,
+            "output": output,
+            "error": error if error else None,
+            "status": "success" if not error else "error"
+        }
+    
     def search_web(self, query: str, num_results: int = 5) -> Dict[str, Any]:
         """
         Mock web search - in production, this would use a real search API
@@ -204,11 +464,11 @@ class ToolExecutor:
         # In production, you'd use a real search API like Google Custom Search or Bing
         mock_results = [
             {
-                "title": f"Result {i+1} for: {query}",
-                "url": f"https://example.com/result{i+1}",
-                "snippet": f"This is a sample snippet for search result {i+1} related to {query}"
+                "title": f"Result {n} for: {query}",
+                "url": url,
+                "snippet": f"This is a sample snippet for search result {n} related to {query}"
             }
-            for i in range(min(num_results, 5))
+            for n, url in _MOCK_SEARCH_SLOTS[:max(num_results, 0)]
         ]
         
         return {
@@ -221,14 +481,11 @@ class ToolExecutor:
         """
         Get current date and time
         """
-        from datetime import datetime
-        import pytz
-        
         if timezone:
             try:
-                tz = pytz.timezone(timezone)
+                tz = _get_timezone(timezone)
                 dt = datetime.now(tz)
-            except:
+            except (ZoneInfoNotFoundError, ValueError):
                 return {
                     "error": f"Invalid timezone: {timezone}",
                     "status": "error"
@@ -237,7 +494,7 @@ class ToolExecutor:
             dt = datetime.now()
         
         if format:
-            formatted = dt.strftime(format)
+            formatted = _compile_strftime(format)(dt)
         else:
             formatted = dt.isoformat()
         
@@ -247,16 +504,39 @@ class ToolExecutor:
             "timestamp": dt.timestamp()
         }
     
-    def file_operations(self, operation: str, path: str, content: Optional[str] = None) -> Dict[str, Any]:
+    def file_operations(self, operation: str, path: str, content: Optional[str] = None, binary: bool = False) -> Dict[str, Any]:
         """
         Basic file operations (read, write, list)
         """
-        import os
-        
         try:
             if operation == "read":
-                with open(path, 'r') as f:
-                    content = f.read()
+                if binary:
+                    # Raw bytes straight from the descriptor, sized by fstat; no text decoding
+                    fd = os.open(path, os.O_RDONLY)
+                    try:
+                        chunks = [os.read(fd, max(os.fstat(fd).st_size, 65536))]
+                        while chunks[-1]:
+                            chunks.append(os.read(fd, 65536))
+                    finally:
+                        os.close(fd)
+                    data = b"".join(chunks)
+                    return {
+                        "path": path,
+                        "content": base64.b64encode(data).decode('ascii'),
+                        "encoding": "base64",
+                        "size": len(data)
+                    }
+                
+                with open(path, 'rb') as f:
+                    if os.fstat(f.fileno()).st_size >= _MMAP_READ_THRESHOLD:
+                        # Decode straight from the page cache mapping, skipping the bytes copy
+                        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                            content = str(mapped, 'utf-8')
+                    else:
+                        content = f.read().decode('utf-8')
+                # Same universal-newline translation as a text-mode read
+                if '\r' in content:
+                    content = content.replace('\r\n', '\n').replace('\r', '\n')
                 return {
                     "path": path,
                     "content": content,
@@ -269,21 +549,38 @@ class ToolExecutor:
                         "error": "Content is required for write operation",
                         "status": "error"
                     }
-                with open(path, 'w') as f:
-                    f.write(content)
+                # Encode once and hand the bytes to the kernel directly
+                data = content.encode('utf-8')
+                fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                try:
+                    view = memoryview(data)
+                    while view:
+                        view = view[os.write(fd, view):]
+                finally:
+                    os.close(fd)
                 return {
                     "path": path,
                     "status": "success",
-                    "bytes_written": len(content)
+                    "bytes_written": len(data)
                 }
             
             elif operation == "list":
                 if os.path.isdir(path):
-                    files = os.listdir(path)
+                    # One scandir pass yields names, types and sizes together
+                    with os.scandir(path) as it:
+                        entries = [
+                            {
+                                "name": entry.name,
+                                "is_dir": entry.is_dir(),
+                                "size": entry.stat(follow_symlinks=False).st_size
+                            }
+                            for entry in it
+                        ]
                     return {
                         "path": path,
-                        "files": files,
-                        "count": len(files)
+                        "files": [entry["name"] for entry in entries],
+                        "entries": entries,
+                        "count": len(entries)
                     }
                 else:
                     return {
@@ -411,6 +708,11 @@ TOOL_DEFINITIONS = [
                 "content": {
                     "type": "string",
                     "description": "Content to write (required for write operation)"
+                },
+                "binary": {
+                    "type": "boolean",
+                    "description": "For read: return the raw bytes base64-encoded instead of UTF-8 text",
+                    "default": False
                 }
             },
             "required": ["operation", "path"]
@@ -420,3 +722,45 @@ TOOL_DEFINITIONS = [
 
 # Merge with DesktopCommander tools
 TOOL_DEFINITIONS.extend(DESKTOP_COMMANDER_TOOLS)
+
+def _build_shim(tool_def: Dict[str, Any], func) -> Optional[Any]:
+    """
+    Generate a caller that unpacks a tool's arguments positionally, following
+    its JSON schema and signature. Calls with missing or unexpected keys fall
+    back to func(self, **arguments) so they fail with the usual TypeError.
+    """
+    params = list(inspect.signature(func).parameters.values())[1:]
+    properties = tool_def["parameters"].get("properties", {})
+    if {param.name for param in params} != set(properties):
+        return None
+    
+    namespace = {"_func": func}
+    required, optional, call_args = [], [], []
+    for param in params:
+        if param.default is inspect.Parameter.empty:
+            required.append(param.name)
+            call_args.append(f"a[{param.name!r}]")
+        else:
+            optional.append(param.name)
+            namespace[f"_default_{param.name}"] = param.default
+            call_args.append(f"a.get({param.name!r}, _default_{param.name})")
+    
+    guard = [f"{name!r} not in a" for name in required]
+    guard.append(f"len(a) != {' + '.join([str(len(required))] + [f'({name!r} in a)' for name in optional])}")
+    source = (
+        f"def _call_{tool_def['name']}(self, a):\n"
+        f"    if {' or '.join(guard)}:\n"
+        f"        return _func(self, **a)\n"
+        f"    return _func(self, {', '.join(call_args)})\n"
+    )
+    exec(source, namespace)
+    return namespace[f"_call_{tool_def['name']}"]
+
+# Generated argument shims for ToolExecutor's own tools: name -> (function, shim)
+_SHIMS = {}
+for _tool_def in TOOL_DEFINITIONS:
+    _func = getattr(ToolExecutor, _tool_def["name"], None)
+    _shim = _build_shim(_tool_def, _func) if callable(_func) else None
+    if _shim is not None:
+        _SHIMS[_tool_def["name"]] = (_func, _shim)
+del _tool_def, _func, _shim